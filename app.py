@@ -1,18 +1,71 @@
 # app.py
 import os 
 import streamlit as st
+import numpy as np
 import json
 import smtplib
 import random
+import tempfile
+import threading
 from email.message import EmailMessage
 from datetime import date, datetime, timedelta
 
 DB_FILE = "tasks.json"
 
+HEADERS = (
+    "What's new for today? 🌤️",
+    "Are you ready for a fresh new day? 🌈",
+    "Good to see you again! Eager for some productivity? 💪",
+    "Keep on with the good work! 😊",
+    "What a lovely day for a new adventure! 🎵",
+)
+
+REMINDER_SUBJECT = "⏰ Reminder: '{name}' due tomorrow"
+REMINDER_TEMPLATE = """
+Hey there!
+
+Just a friendly reminder that your task:
+
+  📌 {name}
+
+is due on:
+
+  📅 {due}
+
+Good luck!
+
+-Smart Study Planner
+"""
+
+@st.cache_resource
+def _task_cache():
+    # Lives across reruns (plain module globals are reset on every Streamlit rerun)
+    # and is shared by every session, so "entry" is only read or swapped under
+    # "lock". It holds (mtime, data) as one tuple so the two never get mismatched.
+    return {"lock": threading.Lock(), "entry": (None, None)}
+
+
+@st.cache_resource
+def _umask():
+    # os.umask can only be read by setting it, which is process-wide, so do it
+    # once per process rather than on every save while other sessions run
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
 def load_tasks():
+    cache = _task_cache()
     try:
-        with open(DB_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with cache["lock"]:
+            mtime = os.stat(DB_FILE).st_mtime_ns
+            cached_mtime, data = cache["entry"]
+            if mtime != cached_mtime:
+                with open(DB_FILE, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                cache["entry"] = (mtime, data)
+        # Tasks are flat dicts, so a shallow copy each keeps callers from mutating the cache
+        return [dict(t) for t in data]
     except FileNotFoundError:
         return []
     except json.JSONDecodeError:
@@ -28,19 +81,50 @@ def load_tasks():
 
 
 def save_tasks(tasks):
-    with open(DB_FILE, "w", encoding="utf-8") as f:
-        json.dump(tasks, f, indent=2)
+    # Keys starting with "_" are per-run caches (e.g. parsed dates), never persisted
+    data = [{k: v for k, v in t.items() if not k.startswith("_")} for t in tasks]
+    cache = _task_cache()
+    with cache["lock"]:
+        # Write compact JSON to a uniquely named temp file next to tasks.json and
+        # swap it in, so a crash mid-write can't leave a truncated tasks.json
+        # behind and concurrent saves never share a temp file
+        fd, tmp = tempfile.mkstemp(
+            prefix=os.path.basename(DB_FILE) + ".", suffix=".tmp",
+            dir=os.path.dirname(os.path.abspath(DB_FILE)),
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+                f.flush()
+                # os.replace keeps this mtime, so it's exactly what load_tasks will see
+                mtime = os.fstat(f.fileno()).st_mtime_ns
+            # mkstemp creates the file as 0600; keep tasks.json's existing permissions
+            try:
+                os.chmod(tmp, os.stat(DB_FILE).st_mode)
+            except FileNotFoundError:
+                # First save: use the umask-based mode a plain open() would have given
+                os.chmod(tmp, 0o666 & ~_umask())
+            os.replace(tmp, DB_FILE)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+        # Write-through so the next rerun doesn't re-read what we just wrote
+        cache["entry"] = (mtime, data)
 
 
 def parse_date(d):
-    return datetime.strptime(d, "%Y-%m-%d").date()
+    return date.fromisoformat(d)
 
 
 def generate_plan(tasks, weekday_cap_hours=3.0, weekend_cap_hours=2.0):
     today = date.today()
 
-    active = [t for t in tasks if t["remaining_hours"] > 0]
-    active.sort(key=lambda t: (parse_date(t["due_date"]), t["priority"]))
+    active = [t for t in tasks if not t["archived"] and t["_remaining"] > 0]
+    active.sort(key=lambda t: (t["_due"], t["priority"]))
 
     plan = {}
     warnings = []
@@ -48,94 +132,126 @@ def generate_plan(tasks, weekday_cap_hours=3.0, weekend_cap_hours=2.0):
     if not active:
         return plan, warnings
 
-    last_due = max(parse_date(t["due_date"]) for t in active)
-
-    # Create days + capacity (weekday vs weekend)
-    cap = {}
-    day = today
-    while day <= last_due:
-        dkey = str(day)
-        plan[dkey] = []
-
-        # weekday: Mon(0)..Fri(4), weekend: Sat(5), Sun(6)
-        if day.weekday() >= 5:
-            cap[dkey] = float(weekend_cap_hours)
-        else:
-            cap[dkey] = float(weekday_cap_hours)
-
-        day += timedelta(days=1)
-
-    # Allocate hours greedily
-    for t in active:
-        if t["archived"] == True:
-            continue
-        due = parse_date(t["due_date"])
-        hours_left = t["remaining_hours"]
-        day = parse_date(t["start_date"])
-
-        while day <= due and hours_left > 0:
-            dkey = str(day)
-            if cap.get(dkey, 0) > 0:
-                h = min(cap[dkey], hours_left)
-                plan[dkey].append((t["name"], round(h, 2)))
-                cap[dkey] -= h
-                hours_left -= h
-            day += timedelta(days=1)
+    last_due = max(t["_due"] for t in active)
+
+    # Struct-of-arrays view of the sorted tasks, so the hot loop indexes lists
+    # instead of hashing dict keys
+    names = [t["name"] for t in active]
+    starts = [t["_start"].toordinal() for t in active]
+    dues = [t["_due"].toordinal() for t in active]
+    hours = [t["_remaining"] for t in active]
+
+    # Capacity per day from today through the last due date (weekday vs weekend).
+    # The range is dense, so a day's index is just its ordinal minus today's.
+    base = today.toordinal()
+    n_days = max(0, last_due.toordinal() - base + 1)
+
+    # weekday: Mon(0)..Fri(4), weekend: Sat(5), Sun(6); day i is today + i
+    weekdays = (np.arange(n_days) + today.weekday()) % 7
+    cap = np.where(weekdays >= 5, float(weekend_cap_hours), float(weekday_cap_hours))
+
+    # Allocate hours greedily. Days only ever lose capacity, so everything
+    # before first_open stays full and later tasks can start past it.
+    first_open = 0
+    for k in range(len(active)):
+        hours_left = hours[k]
+        s = max(first_open, starts[k] - base)
+        e = dues[k] - base + 1
+
+        if s < e:
+            # Take every open day until the running total covers the task,
+            # then only what's still needed from the last one
+            avail = cap[s:e]
+            csum = np.cumsum(avail)
+            n = int(np.searchsorted(csum, hours_left))
+            if n < len(avail):
+                take = avail[:n + 1].copy()
+                take[n] = hours_left - (csum[n - 1] if n else 0.0)
+                hours_left = 0.0
+            else:
+                take = avail.copy()
+                hours_left -= float(csum[-1])
+            cap[s:s + len(take)] -= take
+
+            for j in np.flatnonzero(take > 0):
+                plan.setdefault(base + s + int(j), []).append((names[k], round(float(take[j]), 2)))
+
+        while first_open < n_days and cap[first_open] <= 0:
+            first_open += 1
 
         if hours_left > 0:
             warnings.append(
-                f"Not enough time for **{t['name']}**: short by {round(hours_left,2)} hours before {t['due_date']}."
+                f"Not enough time for **{names[k]}**: short by {round(hours_left,2)} hours before {active[k]['due_date']}."
             )
 
-    # Remove empty days for cleaner display
-    plan = {d: items for d, items in plan.items() if items}
+    # Keys are day ordinals added in task order. Sort them once here so callers
+    # get days in calendar order, then format them for display.
+    plan = {date.fromordinal(d).isoformat(): items for d, items in sorted(plan.items())}
     return plan, warnings
 
 
-def SendReminderEmails(address, name, due_date):
-    sender = st.secrets.get("EMAIL")
-    password = st.secrets.get("PASSWORD")
+def SendReminderEmails(reminders):
+    # Sends one reminder per task over a single SMTP session.
+    # Returns a (task, error) pair for every task, error being None when the
+    # send succeeded. Failures are reported per task rather than raised, so
+    # reminders already delivered are never lost to a later error.
+    try:
+        sender = st.secrets.get("EMAIL")
+        password = st.secrets.get("PASSWORD")
+    except Exception as e:
+        # No secrets.toml raises StreamlitSecretNotFoundError (a FileNotFoundError),
+        # which Mapping.get doesn't catch; a malformed one raises its own errors
+        st.error(f"Could not read EMAIL/PASSWORD from Streamlit secrets: {e}")
+        return []
 
     if not sender or not password:
         st.error("Missing EMAIL/PASSWORD in Streamlit secrets.")
-        return
-
-    
-    message = EmailMessage()
-    message["From"] = sender
-    message["To"] = address
-    message["Subject"] = f"⏰ Reminder: '{name}' due tomorrow"
-    message.set_content(
-        f"""
-Hey there!
-
-Just a friendly reminder that your task:
-
-  📌 {name}
-
-is due on:
-
-  📅 {due_date}
-
-Good luck!
+        return []
 
--Smart Study Planner
-"""
-)
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
+    results = []
+    server = None
+    try:
+        server = smtplib.SMTP_SSL("smtp.gmail.com", 465)
         server.login(sender, password)
-        server.send_message(message)
+        for t in reminders:
+            try:
+                message = EmailMessage()
+                message["From"] = sender
+                message["To"] = t["email"]
+                message["Subject"] = REMINDER_SUBJECT.format(name=t["name"])
+                message.set_content(REMINDER_TEMPLATE.format(name=t["name"], due=t["due_date"]))
+                server.send_message(message)
+                results.append((t, None))
+            except Exception as e:
+                results.append((t, e))
+    except Exception as e:
+        # Connecting or logging in failed, so none of the remaining tasks were sent
+        results.extend((t, e) for t in reminders[len(results):])
+    finally:
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                # Everything has been sent (or not) by now; just drop the connection
+                server.close()
+    return results
 
 st.set_page_config(page_title="Smart Study Planner", layout="centered")
 st.title("📚 Smart Study Planner")
 
 tasks = load_tasks()
 
-# Normalize tasks (add remaining_hours field)
-for t in tasks:
-    if "done_hours" not in t:
-        t["done_hours"] = 0.0
-    t["remaining_hours"] = max(0.0, float(t["estimated_hours"]) - float(t["done_hours"]))
+# Normalize tasks (fill in missing fields), splitting them into
+# active/archived once so the tabs below don't each rescan the full list
+active_tasks = []
+archived_tasks = []
+for i, t in enumerate(tasks):
+    # Hours are floats from here on, so the tabs below don't need to convert them
+    t["estimated_hours"] = float(t["estimated_hours"])
+    t["done_hours"] = float(t.get("done_hours", 0.0))
+    # Remaining hours are derived (estimated - done); drop copies saved by older versions
+    t.pop("remaining_hours", None)
+    t["_remaining"] = max(0.0, t["estimated_hours"] - t["done_hours"])
     if "email" not in t:
         t["email"] = []
     if "email_sent" not in t:
@@ -144,21 +260,31 @@ for t in tasks:
         t["archived"] = False
     if "start_date" not in t:
         t["start_date"] = str(date.today())
+    # Parse dates once per run; generate_plan and the tabs below reuse these
+    t["_due"] = parse_date(t["due_date"])
+    t["_start"] = parse_date(t["start_date"])
+    # Position in the full list, so widget keys stay stable across filtering
+    t["_idx"] = i
+    if t["archived"]:
+        archived_tasks.append(t)
+    else:
+        active_tasks.append(t)
 
 tasks_updated = False
 today = date.today()
-for t in tasks:
-    due_date_obj = parse_date(t["due_date"])
-    if t.get("email") and not t.get("email_sent", False):
-        # Check if task is due tomorrow
-        if due_date_obj - timedelta(days=1) == today:
-            try:
-                SendReminderEmails(t["email"], t["name"], t["due_date"])
+pending = [t for t in tasks if t.get("email") and not t.get("email_sent", False)]
+if pending:
+    tomorrow = today + timedelta(days=1)
+    # Only tasks due tomorrow get a reminder
+    due_tomorrow = [t for t in pending if t["_due"] == tomorrow]
+    if due_tomorrow:
+        for t, error in SendReminderEmails(due_tomorrow):
+            if error is None:
                 t["email_sent"] = True
                 tasks_updated = True
                 st.success(f"Reminder sent for '{t['name']}'!")
-            except Exception as e:
-                st.error(f"Failed to send email for '{t['name']}': {e}")
+            else:
+                st.error(f"Failed to send email for '{t['name']}': {error}")
 
 # Save updates if any emails were sent
 if tasks_updated:
@@ -167,23 +293,14 @@ if tasks_updated:
 tab1, tab2, tab3, tab4, tab5= st.tabs(["📰 Today's Tasks", "➕ Add Task", "📋 All Tasks", "🗓️ Plan", "📓 History"])
 
 with tab1:
-    n = random.randint(1, 5)
-    match n:
-        case 1:
-            header = "What's new for today? 🌤️"
-        case 2:
-            header = "Are you ready for a fresh new day? 🌈"
-        case 3:
-            header = "Good to see you again! Eager for some productivity? 💪"
-        case 4:
-            header = "Keep on with the good work! 😊"
-        case 5:
-            header = "What a lovely day for a new adventure! 🎵"
-    st.subheader(header)
+    # Pick a greeting once per session so it doesn't change on every click
+    if "header" not in st.session_state:
+        st.session_state["header"] = random.choice(HEADERS)
+    st.subheader(st.session_state["header"])
     no_task = True
     index = 1
-    for t in tasks:
-        if t["archived"] == False and parse_date(t["start_date"]) <= parse_date(str(date.today())) and parse_date(str(date.today())) <= parse_date(t["due_date"]):
+    for t in active_tasks:
+        if t["_start"] <= today <= t["_due"]:
             cols = st.columns([1, 8])
             cols[0].write(f"{index}.")
             cols[1].write(f"**{t['name']}**")
@@ -209,7 +326,7 @@ with tab2:
                 "name": name.strip(),
                 "start_date": str(start),
                 "due_date": str(due),
-                "estimated_hours": float(hours),
+                "estimated_hours": hours,
                 "done_hours": 0.0,
                 "priority": int(priority),
                 "email": email.strip(),
@@ -222,17 +339,12 @@ with tab2:
 
 with tab3:
     st.subheader("Your tasks")
-    no_task = True
-    for t in tasks:
-        if t["archived"] == False:
-            no_task = False
-    if no_task:
+    if not active_tasks:
         st.info("No tasks yet. Add one!")
     else:
-        for i, t in enumerate(tasks):
-            if t["archived"] == True:
-                continue
-            remaining = max(0.0, t["estimated_hours"] - t["done_hours"])
+        for t in active_tasks:
+            i = t["_idx"]
+            remaining = t["_remaining"]
             progress = min(1.0, t["done_hours"] / t["estimated_hours"])
             percent = int(100 * progress)
             cols = st.columns([3, 2, 2, 2])
@@ -241,7 +353,7 @@ with tab3:
             cols[2].write(f"Remaining: {remaining:.1f}h")
             add_done = cols[3].number_input(
                 "Add done hours",
-                min_value=0.0, max_value=float(t["estimated_hours"]), value=0.0, step=0.5,
+                min_value=0.0, max_value=t["estimated_hours"], value=0.0, step=0.5,
                 key=f"done_{i}"
             )
             st.progress(progress, text = f"{percent}% complete")
@@ -249,12 +361,12 @@ with tab3:
 
             if edit_open:
                 with st.expander("Edit task", expanded=True):
-                    new_due = st.date_input("Due date", value=parse_date(t["due_date"]), key=f"due_edit_{i}")
+                    new_due = st.date_input("Due date", value=t["_due"], key=f"due_edit_{i}")
                     new_est = st.number_input(
                         "Estimated hours",
                         min_value=0.5,
                         max_value=200.0,
-                        value=float(t["estimated_hours"]),
+                        value=t["estimated_hours"],
                         step=0.5,
                         key=f"est_edit_{i}",
                     )
@@ -264,18 +376,18 @@ with tab3:
                     new_remaining = st.number_input(
                         "Remaining hours",
                         min_value=0.0,
-                        max_value=float(new_est),
-                        value=max(0.0, float(new_est) - float(t["done_hours"])),
+                        max_value=new_est,
+                        value=max(0.0, new_est - t["done_hours"]),
                         step=0.5,
                         key=f"rem_edit_{i}",
                     )
 
                     if st.button("Save edits", key=f"save_edit_{i}"):
                         t["due_date"] = str(new_due)
-                        t["estimated_hours"] = float(new_est)
+                        t["estimated_hours"] = new_est
 
                         # Convert "remaining hours" into done_hours
-                        t["done_hours"] = max(0.0, float(new_est) - float(new_remaining))
+                        t["done_hours"] = max(0.0, new_est - new_remaining)
 
                         # If due date changed, you probably want to allow email again:
                         t["email_sent"] = False
@@ -301,11 +413,8 @@ with tab4:
     st.subheader("Generate your plan")
     weekday_cap = st.slider("Max study hours per weekday (Mon–Fri)", 0.0, 10.0, 3.0, 0.5)
     weekend_cap = st.slider("Max study hours per weekend day (Sat–Sun)", 0.0, 10.0, 2.0, 0.5)
-    # Recompute remaining hours
-    for t in tasks:
-        t["remaining_hours"] = max(0.0, float(t["estimated_hours"]) - float(t["done_hours"]))
 
-    plan, warnings = generate_plan(tasks, weekday_cap_hours=float(weekday_cap), weekend_cap_hours=float(weekend_cap))
+    plan, warnings = generate_plan(active_tasks, weekday_cap_hours=weekday_cap, weekend_cap_hours=weekend_cap)
 
     if warnings:
         for w in warnings:
@@ -314,6 +423,7 @@ with tab4:
     if not plan:
         st.info("Nothing to schedule (either no tasks or all done).")
     else:
+        # generate_plan returns days already in calendar order
         for day, items in plan.items():
             st.markdown(f"### {day}")
             for task_name, h in items:
@@ -321,16 +431,11 @@ with tab4:
 
 with tab5:
     st.subheader("View plan history")
-    no_task = True
-    for t in tasks:
-        if t["archived"] == True:
-            no_task = False
-    if no_task:
+    if not archived_tasks:
         st.info("No history to view yet")
     else:
-        for i, t in enumerate(tasks):
-            if t["archived"] == False:
-                continue
+        for t in archived_tasks:
+            i = t["_idx"]
             cols = st.columns([3, 2, 2, 2])
             cols[0].write(f"**{t['name']}**")
             cols[1].write(f"Due: {t['due_date']}")